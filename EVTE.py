@@ -1,7 +1,10 @@
+import io
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 
 
 # Configuração da página
@@ -31,6 +34,30 @@ parametros_base = {
     'custos_fixos_anuais': 1500000.0  # US$
 }
 
+# Vetores anuais que não dependem dos parâmetros sorteados (calculados uma única vez)
+ANOS = np.arange(parametros_base['anos_projeto'] + 1)
+
+# Fator de desconto pela TMA
+FATOR_DESCONTO = 1 / (1 + parametros_base['taxa_minima_atratividade'] / 100) ** ANOS
+
+# Produção base anual nos primeiros 5 anos (bpd * 365)
+PRODUCAO_BASE_ANUAL = np.array([0, 500, 1200, 1800, 2000], dtype=float) * 365
+
+# Anos decorridos desde o pico de produção (ano 4) para os anos 5 em diante
+ANOS_DECLINIO = ANOS[5:] - 4
+
+# Fração do investimento desembolsada em cada ano: 50% no ano 0, 30% no ano 1 e 20% no ano 2
+FRACAO_INVESTIMENTO = np.zeros(ANOS.size)
+FRACAO_INVESTIMENTO[:3] = [0.5, 0.3, 0.2]
+
+# Fração do investimento depreciada em cada ano: 80% depreciável em 10 anos
+FRACAO_DEPRECIACAO = np.zeros(ANOS.size)
+FRACAO_DEPRECIACAO[1:11] = 0.8 / 10
+
+# Custos fixos anuais (não há custos fixos no ano 0)
+CUSTOS_FIXOS = np.full(ANOS.size, parametros_base['custos_fixos_anuais'])
+CUSTOS_FIXOS[0] = 0
+
 # Interface de usuário simplificada
 st.sidebar.header("Parâmetros da Simulação")
 
@@ -52,97 +79,123 @@ investimento_max = st.sidebar.slider("Investimento Máximo (US$ milhões)", 50.0
 eficiencia_min = st.sidebar.slider("Incremento Mínimo no Fator de Recuperação (pp)", 9.0, 12.0, 10.0, 1.0)
 eficiencia_max = st.sidebar.slider("Incremento Máximo no Fator de Recuperação (pp)", 15.0, 20.0, 18.0, 1.0)
 
+# Função para calcular a TIR de cada linha de uma matriz de fluxos de caixa
+# Método de Newton protegido por bisseção, aplicado simultaneamente a todas as
+# simulações. A raiz é procurada primeiro entre 0 e taxa_max e, se não houver
+# troca de sinal do VPL nesse intervalo, entre taxa_min e 0; as linhas sem
+# troca de sinal em nenhum dos dois (fluxos sem TIR real) ficam com NaN
+def calcular_tir(fluxo_caixa, taxa_min=-0.99, taxa_max=10.0, max_iteracoes=100, tolerancia=1e-8):
+    # Fluxos ponderados pelo ano (usados na derivada do VPL), calculados uma única vez;
+    # os produtos linha a linha são somados com einsum, sem matrizes temporárias
+    fluxo_ponderado = fluxo_caixa * ANOS[None, :]
+    
+    def vpl_e_derivada(taxa):
+        desconto = (1 + taxa[:, None]) ** -ANOS[None, :]
+        vpl = np.einsum('ij,ij->i', fluxo_caixa, desconto)
+        derivada = -np.einsum('ij,ij->i', fluxo_ponderado, desconto) / (1 + taxa)
+        return vpl, derivada
+    
+    num_linhas = fluxo_caixa.shape[0]
+    vpl_min, _ = vpl_e_derivada(np.full(num_linhas, taxa_min))
+    vpl_zero, _ = vpl_e_derivada(np.zeros(num_linhas))
+    vpl_max, _ = vpl_e_derivada(np.full(num_linhas, taxa_max))
+    
+    raiz_positiva = np.sign(vpl_zero) != np.sign(vpl_max)
+    existe_tir = raiz_positiva | (np.sign(vpl_min) != np.sign(vpl_zero))
+    inferior = np.where(raiz_positiva, 0.0, taxa_min)
+    superior = np.where(raiz_positiva, taxa_max, 0.0)
+    vpl_inferior = np.where(raiz_positiva, vpl_zero, vpl_min)
+    
+    # Chute inicial na TMA quando ela está no intervalo, senão no ponto médio
+    tma = parametros_base['taxa_minima_atratividade'] / 100
+    taxa = np.where((inferior < tma) & (tma < superior), tma, (inferior + superior) / 2)
+    
+    # Linhas já convergidas (ou sem TIR) deixam de ser atualizadas
+    convergiu = ~existe_tir
+    for _ in range(max_iteracoes):
+        vpl, derivada = vpl_e_derivada(taxa)
+        
+        # Atualizar o intervalo que contém a raiz
+        mesmo_sinal = np.sign(vpl) == np.sign(vpl_inferior)
+        inferior = np.where(mesmo_sinal, taxa, inferior)
+        vpl_inferior = np.where(mesmo_sinal, vpl, vpl_inferior)
+        superior = np.where(mesmo_sinal, superior, taxa)
+        
+        # Passo de Newton; bisseção quando o passo sai do intervalo
+        nova_taxa = taxa - np.divide(vpl, derivada, out=np.full_like(vpl, np.inf), where=derivada != 0)
+        fora = ~((nova_taxa > inferior) & (nova_taxa < superior))
+        nova_taxa = np.where(fora, (inferior + superior) / 2, nova_taxa)
+        
+        passo_pequeno = np.abs(nova_taxa - taxa) < tolerancia
+        taxa = np.where(convergiu, taxa, nova_taxa)
+        convergiu = convergiu | passo_pequeno
+        if convergiu.all():
+            break
+    
+    return np.where(existe_tir, taxa * 100, np.nan)  # Em %
+
 # Função simplificada para calcular VPL e TIR
+# Os parâmetros são vetores de comprimento N (um valor por simulação) e os
+# fluxos anuais são matrizes de dimensão (N, anos_projeto + 1)
 def calcular_indicadores(parametros):
-    # Extrair parâmetros
-    preco = parametros['preco']
-    investimento = parametros['investimento']
-    eficiencia = parametros['eficiencia']
-    custo = parametros['custo']
-    declinio = parametros['declinio']
+    # Extrair parâmetros (os fluxos de caixa são calculados em float64)
+    preco = np.asarray(parametros['preco'], dtype=np.float64)
+    investimento = np.asarray(parametros['investimento'], dtype=np.float64)
+    eficiencia = np.asarray(parametros['eficiencia'], dtype=np.float64)
+    custo = np.asarray(parametros['custo'], dtype=np.float64)
+    declinio = np.asarray(parametros['declinio'], dtype=np.float64)
+    num_simulacoes = preco.shape[0]
     
     # Parâmetros fixos
     anos_projeto = parametros_base['anos_projeto']
-    taxa_minima_atratividade = parametros_base['taxa_minima_atratividade']
     custo_polimero = parametros_base['custo_polimero']
-    custos_fixos_anuais = parametros_base['custos_fixos_anuais']
     
     # Fator de ajuste para eficiência
     fator_eficiencia = eficiencia / parametros_base['incremento_recuperacao']
     
-    # Produção base e ajustada (simplificada)
-    producao_base = [0, 500, 1200, 1800, 2000]  # bpd nos primeiros 5 anos
-    producao_ajustada = [p * fator_eficiencia for p in producao_base]
-    
-    # Calcular produção com declínio após o pico
-    for ano in range(5, anos_projeto + 1):
-        producao_anterior = producao_ajustada[ano - 1]
-        producao_atual = producao_anterior * (1 - declinio / 100)
-        producao_ajustada.append(producao_atual)
-    
-    # Converter para produção anual
-    producao_anual = [p * 365 for p in producao_ajustada]
+    # Produção anual ajustada (simplificada)
+    producao_anual = np.empty((num_simulacoes, anos_projeto + 1))
+    producao_anual[:, :5] = PRODUCAO_BASE_ANUAL[None, :] * fator_eficiencia[:, None]
     
-    # Receitas
-    receita_bruta = [p * preco * 0.9 for p in producao_anual]  # Desconto de 10% pela qualidade
-    royalties = [r * 0.1 for r in receita_bruta]  # 10% de royalties
-    receita_liquida = [r - roy for r, roy in zip(receita_bruta, royalties)]
+    # Calcular produção com declínio após o pico (forma fechada da progressão geométrica)
+    fator_declinio = (1 - declinio / 100)[:, None] ** ANOS_DECLINIO[None, :]
+    producao_anual[:, 5:] = producao_anual[:, 4:5] * fator_declinio
     
-    # Investimentos (simplificado)
-    investimentos = [0] * (anos_projeto + 1)
-    investimentos[0] = investimento * 0.5  # 50% no ano 0
-    investimentos[1] = investimento * 0.3  # 30% no ano 1
-    investimentos[2] = investimento * 0.2  # 20% no ano 2
+    # Margem por barril: receita líquida (desconto de 10% pela qualidade e
+    # 10% de royalties) menos os custos variáveis e de polímero
+    margem_por_barril = preco * 0.9 * (1 - 0.1) - custo - custo_polimero
     
-    # Custos operacionais
-    custos_fixos = [custos_fixos_anuais] * (anos_projeto + 1)
-    custos_fixos[0] = 0  # Não há custos fixos no ano 0
+    # Investimentos e depreciação (simplificados)
+    investimentos = investimento[:, None] * FRACAO_INVESTIMENTO[None, :]
+    depreciacao = investimento[:, None] * FRACAO_DEPRECIACAO[None, :]
     
-    custos_variaveis = [p * custo for p in producao_anual]
-    custos_polimero = [p * custo_polimero for p in producao_anual]
-    custos_totais = [f + v + p for f, v, p in zip(custos_fixos, custos_variaveis, custos_polimero)]
+    # Lucro antes dos impostos e fluxo de caixa (34% de impostos sobre o lucro positivo)
+    lucro_antes_impostos = producao_anual * margem_por_barril[:, None] - CUSTOS_FIXOS[None, :] - depreciacao
+    fluxo_caixa = lucro_antes_impostos - np.maximum(0, lucro_antes_impostos * 0.34) + depreciacao - investimentos
     
-    # Depreciação (simplificada)
-    depreciacao = [0] * (anos_projeto + 1)
-    valor_depreciavel = investimento * 0.8  # 80% do investimento é depreciável
-    for ano in range(1, min(11, anos_projeto + 1)):
-        depreciacao[ano] = valor_depreciavel / 10  # Depreciação em 10 anos
+    # Fluxo de caixa descontado e acumulado (uma única soma acumulada por linha)
+    fluxo_caixa_descontado = fluxo_caixa * FATOR_DESCONTO[None, :]
+    fluxo_acumulado = np.cumsum(fluxo_caixa_descontado, axis=1)
     
-    # Lucro e impostos
-    lucro_antes_impostos = [r - c - d for r, c, d in zip(receita_liquida, custos_totais, depreciacao)]
-    impostos = [max(0, l * 0.34) for l in lucro_antes_impostos]  # 34% de impostos
-    lucro_liquido = [l - i for l, i in zip(lucro_antes_impostos, impostos)]
+    # VPL (último ano do fluxo descontado acumulado)
+    vpl = fluxo_acumulado[:, -1]
     
-    # Fluxo de caixa
-    fluxo_caixa = [ll + d - inv for ll, d, inv in zip(lucro_liquido, depreciacao, investimentos)]
+    # TIR
+    tir = calcular_tir(fluxo_caixa)
     
-    # Fluxo de caixa descontado
-    fator_desconto = [1 / (1 + taxa_minima_atratividade / 100) ** ano for ano in range(anos_projeto + 1)]
-    fluxo_caixa_descontado = [fc * fd for fc, fd in zip(fluxo_caixa, fator_desconto)]
-    
-    # VPL
-    vpl = sum(fluxo_caixa_descontado)
+    # Payback descontado (simplificado)
+    recuperado = fluxo_acumulado >= 0
+    ano_recuperacao = recuperado.argmax(axis=1)  # Primeiro ano com fluxo acumulado não negativo
     
-    # TIR (simplificada)
-    if vpl <= 0:
-        tir = 0
-    else:
-        # Estimativa da TIR baseada na relação entre VPL e investimento
-        tir = (vpl / investimento) * 15 + 12  # Fórmula aproximada
-        tir = min(tir, 50)  # Limitar a TIR máxima
+    # Interpolação linear entre o último ano negativo e o ano de recuperação
+    ano_anterior = np.maximum(ano_recuperacao - 1, 0)
+    acumulado_anterior = np.take_along_axis(fluxo_acumulado, ano_anterior[:, None], axis=1)[:, 0]
+    acumulado_atual = np.take_along_axis(fluxo_acumulado, ano_recuperacao[:, None], axis=1)[:, 0]
+    variacao = np.where(ano_recuperacao > 0, np.abs(acumulado_atual - acumulado_anterior), 1)
+    payback = ano_anterior + np.abs(acumulado_anterior) / variacao
     
-    # Payback descontado (simplificado)
-    fluxo_acumulado = np.cumsum(fluxo_caixa_descontado)
-    if all(f < 0 for f in fluxo_acumulado):
-        payback = anos_projeto  # Não recupera o investimento no período
-    else:
-        for i in range(1, len(fluxo_acumulado)):
-            if fluxo_acumulado[i-1] < 0 and fluxo_acumulado[i] >= 0:
-                # Interpolação linear
-                payback = i - 1 + abs(fluxo_acumulado[i-1]) / abs(fluxo_acumulado[i] - fluxo_acumulado[i-1])
-                break
-        else:
-            payback = 0  # Recupera imediatamente (caso improvável)
+    payback = np.where(ano_recuperacao == 0, 0, payback)  # Recupera imediatamente (caso improvável)
+    payback = np.where(recuperado.any(axis=1), payback, anos_projeto)  # Não recupera o investimento no período
     
     return {
         'VPL': vpl,
@@ -153,53 +206,97 @@ def calcular_indicadores(parametros):
     }
 
 # Função simplificada para realizar a simulação de Monte Carlo
-def simular_monte_carlo(num_simulacoes):
-    np.random.seed(42)  # Seed fixo para reprodutibilidade
+# O resultado fica em cache (também em disco, sobrevivendo a reinícios do
+# Streamlit) para cada combinação de parâmetros da barra lateral e semente
+@st.cache_data(show_spinner=False, max_entries=16, persist="disk")
+def simular_monte_carlo(num_simulacoes, preco_min, preco_max, investimento_min, investimento_max,
+                        eficiencia_min, eficiencia_max, semente=42):
+    rng = np.random.default_rng(semente)  # Seed fixo para reprodutibilidade
     
-    resultados = []
+    # Gerar valores aleatórios para os parâmetros em um único sorteio float32
+    # (uma linha por parâmetro); os fluxos de caixa continuam em float64, pois
+    # as constantes anuais são float64
+    minimos = np.array([preco_min, investimento_min, eficiencia_min, 6.8, 2.0], dtype=np.float32)
+    maximos = np.array([preco_max, investimento_max, eficiencia_max, 10.4, 10.0], dtype=np.float32)
+    sorteio = rng.random((5, num_simulacoes), dtype=np.float32)
+    preco, investimento, eficiencia, custo, declinio = minimos[:, None] + (maximos - minimos)[:, None] * sorteio
     
-    for i in range(num_simulacoes):
-        # Gerar valores aleatórios para os parâmetros
-        preco = np.random.uniform(preco_min, preco_max)
-        investimento = np.random.uniform(investimento_min, investimento_max) * 1000000  # Converter para US$
-        eficiencia = np.random.uniform(eficiencia_min, eficiencia_max)
-        custo = np.random.uniform(6.8, 10.4)  # Valores fixos para simplificar
-        declinio = np.random.uniform(2.0, 10.0)  # Valores fixos para simplificar
-        
-        parametros_simulacao = {
-            'preco': preco,
-            'investimento': investimento,
-            'eficiencia': eficiencia,
-            'custo': custo,
-            'declinio': declinio
-        }
-        
-        indicadores = calcular_indicadores(parametros_simulacao)
-        
-        resultados.append({
-            'Simulação': i + 1,
-            'Preço do Petróleo (US$/barril)': preco,
-            'Investimento Total (US$)': investimento,
-            'Incremento Fator Recuperação (pp)': eficiencia,
-            'Custo Operacional Variável (US$/barril)': custo,
-            'Taxa de Declínio (%/ano)': declinio,
-            'VPL (US$)': indicadores['VPL'],
-            'TIR (%)': indicadores['TIR'],
-            'Payback (anos)': indicadores['Payback']
-        })
+    investimento = investimento * 1000000  # Converter para US$
+    # custo (6.8 a 10.4) e declinio (2.0 a 10.0) usam valores fixos para simplificar
+    
+    parametros_simulacao = {
+        'preco': preco,
+        'investimento': investimento,
+        'eficiencia': eficiencia,
+        'custo': custo,
+        'declinio': declinio
+    }
+    
+    indicadores = calcular_indicadores(parametros_simulacao)
+    
+    return pd.DataFrame({
+        'Simulação': np.arange(1, num_simulacoes + 1, dtype=np.int32),
+        'Preço do Petróleo (US$/barril)': preco,
+        'Investimento Total (US$)': investimento,
+        'Incremento Fator Recuperação (pp)': eficiencia,
+        'Custo Operacional Variável (US$/barril)': custo,
+        'Taxa de Declínio (%/ano)': declinio,
+        'VPL (US$)': indicadores['VPL'].astype(np.float32),
+        'TIR (%)': indicadores['TIR'].astype(np.float32),
+        'Payback (anos)': indicadores['Payback'].astype(np.float32)
+    }, copy=False)  # Os vetores já são novos; não há necessidade de copiá-los
+
+# Função para gerar o CSV dos resultados (em cache, gerado uma vez por resultado)
+@st.cache_data(show_spinner=False)
+def serializar_csv(resultados):
+    buffer = io.BytesIO()
+    resultados.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+# Funções para gerar os gráficos (em cache; as figuras em cache não devem ser alteradas)
+# linhas_verticais é uma tupla de pares (posição, cor) desenhados como linhas tracejadas
+@st.cache_resource(show_spinner=False, max_entries=16)
+def criar_histograma(resultados, coluna, titulo, cor, linhas_verticais):
+    # Classes calculadas com NumPy (valores NaN, como TIR inexistente, são ignorados)
+    valores = resultados[coluna].to_numpy(copy=False)
+    contagens, limites = np.histogram(valores[np.isfinite(valores)], bins=20)
     
-    return pd.DataFrame(resultados)
+    fig = go.Figure(go.Bar(
+        x=(limites[:-1] + limites[1:]) / 2,
+        y=contagens,
+        width=np.diff(limites),
+        marker_color=cor
+    ))
+    fig.update_layout(title=titulo, xaxis_title=coluna, yaxis_title="count", bargap=0)
+    for posicao, cor_linha in linhas_verticais:
+        fig.add_vline(x=posicao, line_dash="dash", line_color=cor_linha)
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def criar_dispersao(resultados):
+    return px.scatter(
+        resultados,
+        x='Preço do Petróleo (US$/barril)',
+        y='VPL (US$)',
+        color='TIR (%)',
+        title="VPL vs. Preço do Petróleo",
+        trendline="ols"
+    )
 
 # Executar simulação quando o botão for pressionado
+# Guarda-se apenas os parâmetros da última simulação; o resultado vem do cache
 if st.sidebar.button("Executar Simulação"):
+    st.session_state.parametros_simulacao = (
+        num_simulacoes, preco_min, preco_max, investimento_min, investimento_max,
+        eficiencia_min, eficiencia_max
+    )
     with st.spinner("Executando simulação de Monte Carlo..."):
-        resultados_simulacao = simular_monte_carlo(num_simulacoes)
-        st.session_state.resultados = resultados_simulacao
+        simular_monte_carlo(*st.session_state.parametros_simulacao)
         st.success(f"Simulação concluída com {num_simulacoes} iterações!")
 
 # Mostrar resultados da simulação se disponíveis
-if 'resultados' in st.session_state:
-    resultados = st.session_state.resultados
+if 'parametros_simulacao' in st.session_state:
+    resultados = simular_monte_carlo(*st.session_state.parametros_simulacao)
     
     # Layout em duas colunas
     col1, col2 = st.columns(2)
@@ -208,15 +305,21 @@ if 'resultados' in st.session_state:
         # Estatísticas descritivas
         st.header("Resultados da Simulação")
         
-        vpl_medio = resultados['VPL (US$)'].mean()
-        vpl_mediano = resultados['VPL (US$)'].median()
-        prob_vpl_negativo = (resultados['VPL (US$)'] < 0).mean() * 100
+        # Estatísticas calculadas diretamente sobre os vetores NumPy de cada coluna
+        # (TIR ignora as simulações sem TIR real, que são NaN)
+        vpl = resultados['VPL (US$)'].to_numpy(copy=False)
+        tir = resultados['TIR (%)'].to_numpy(copy=False)
+        payback = resultados['Payback (anos)'].to_numpy(copy=False)
         
-        tir_media = resultados['TIR (%)'].mean()
-        tir_mediana = resultados['TIR (%)'].median()
-        prob_tir_abaixo_tma = (resultados['TIR (%)'] < parametros_base['taxa_minima_atratividade']).mean() * 100
+        vpl_medio = vpl.mean(dtype=np.float64)
+        vpl_mediano = np.median(vpl)
+        prob_vpl_negativo = np.count_nonzero(vpl < 0) / vpl.size * 100
         
-        payback_medio = resultados['Payback (anos)'].mean()
+        tir_media = np.nanmean(tir, dtype=np.float64)
+        tir_mediana = np.nanmedian(tir)
+        prob_tir_abaixo_tma = np.count_nonzero(tir < parametros_base['taxa_minima_atratividade']) / tir.size * 100
+        
+        payback_medio = payback.mean(dtype=np.float64)
         
         # Métricas em formato de cartões
         st.metric("VPL Médio", f"US$ {vpl_medio:,.2f}")
@@ -226,42 +329,31 @@ if 'resultados' in st.session_state:
         st.metric("Probabilidade de TIR < TMA", f"{prob_tir_abaixo_tma:.2f}%")
         
         # Histograma do VPL
-        fig_vpl = px.histogram(
-            resultados, 
-            x='VPL (US$)',
-            nbins=20,
-            title="Distribuição do VPL",
-            color_discrete_sequence=['#1f77b4']
+        fig_vpl = criar_histograma(
+            resultados,
+            'VPL (US$)',
+            "Distribuição do VPL",
+            '#1f77b4',
+            ((0, "red"), (vpl_medio, "green"))
         )
-        fig_vpl.add_vline(x=0, line_dash="dash", line_color="red")
-        fig_vpl.add_vline(x=vpl_medio, line_dash="dash", line_color="green")
         st.plotly_chart(fig_vpl, use_container_width=True)
     
     with col2:
         # Histograma da TIR
-        fig_tir = px.histogram(
-            resultados, 
-            x='TIR (%)',
-            nbins=20,
-            title="Distribuição da TIR",
-            color_discrete_sequence=['#ff7f0e']
+        fig_tir = criar_histograma(
+            resultados,
+            'TIR (%)',
+            "Distribuição da TIR",
+            '#ff7f0e',
+            ((parametros_base['taxa_minima_atratividade'], "red"), (tir_media, "green"))
         )
-        fig_tir.add_vline(x=parametros_base['taxa_minima_atratividade'], line_dash="dash", line_color="red")
-        fig_tir.add_vline(x=tir_media, line_dash="dash", line_color="green")
         st.plotly_chart(fig_tir, use_container_width=True)
         
         # Análise de sensibilidade simplificada
         st.subheader("Análise de Sensibilidade")
         
         # Gráficos de dispersão para análise de sensibilidade
-        fig_scatter = px.scatter(
-            resultados,
-            x='Preço do Petróleo (US$/barril)',
-            y='VPL (US$)',
-            color='TIR (%)',
-            title="VPL vs. Preço do Petróleo",
-            trendline="ols"
-        )
+        fig_scatter = criar_dispersao(resultados)
         st.plotly_chart(fig_scatter, use_container_width=True)
     
     # Dados brutos em formato de tabela
@@ -269,10 +361,9 @@ if 'resultados' in st.session_state:
     st.dataframe(resultados.head(10))  # Mostrar apenas as primeiras 10 linhas
     
     # Botão para download dos resultados
-    csv = resultados.to_csv(index=False)
     st.download_button(
         label="Download dos Resultados (CSV)",
-        data=csv,
+        data=serializar_csv(resultados),
         file_name="resultados_monte_carlo_simplificado.csv",
         mime="text/csv"
     )